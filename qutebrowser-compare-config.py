@@ -36,11 +36,22 @@ read, never written to.
 
 import sys
 import argparse
+import ast
+import mmap
+import os
 import re
+import signal
+import stat
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from operator import itemgetter
 from pathlib import Path
-from qutebrowser import app  # Needed, because next import would fail without it
-from qutebrowser.config import configdata as qute_configdata
-from qutebrowser.utils import standarddir as qute_standarddir
+
+# The qutebrowser imports are deferred into the functions needing them:
+# importing qutebrowser pulls in Qt and friends, which dominates startup
+# for invocations that never get there (--help, argument errors).
 
 
 __title__ = 'qutebrowser-compare-config.py'
@@ -53,6 +64,31 @@ __license__ = 'GPL'
 __author__ = 'Fabio Rämi'
 
 
+_CONFIG_LINE_RE = re.compile(r'^[ \t]*(?P<comment>#[ \t]?)?'
+                             r'c\.(?P<setting>[^\s=]+)[ \t]*=[ \t]*'
+                             r'(?P<value>.*)$', re.MULTILINE)
+_CONFIG_LINE_RE_B = re.compile(_CONFIG_LINE_RE.pattern.encode('ascii'),
+                               re.MULTILINE)
+# files above this size are mmapped instead of read into a string
+_MMAP_THRESHOLD = 1 << 20
+
+# commented-out defaults repeat the same few literals (True, False, '',
+# ...) over and over, so cache the parsed result per unique string
+parse_value = lru_cache(maxsize=None)(ast.literal_eval)
+
+# one occurrence of a setting in a config-file; much smaller than a
+# per-line dict and attribute access is a C-level tuple index
+Entry = namedtuple('Entry', ['location', 'value', 'defined'])
+
+# sort key shared by the process_* functions; a C callable, so sorting
+# pays no Python frame per comparison
+by_location = itemgetter('location')
+
+# ANSI escapes for the dimmed location/URL column
+DIM = '\033[1;30m'
+RESET = '\033[1;m'
+
+
 def parse_arguments():
     """
     Parse all arguments.
@@ -61,52 +97,82 @@ def parse_arguments():
         """
         Check what to do and set args.print_headers.
         """
-        count = 0
-        args.print_headers = True
-        for i in [args.missing, args.dropped, args.defaults]:
-            if i:
-                count += 1
-        if count == 1:
-            args.print_headers = False
-        elif count == 0:
-            args.missing = True
-            args.dropped = True
-            args.defaults = True
-
-    def handle_path(path):
+        count = args.missing + args.dropped + args.defaults
+        args.print_headers = count != 1
+        if count == 0:
+            args.missing = args.dropped = args.defaults = True
+
+    def walk_py(root, visited_dirs):
+        """
+        Recursively yield all *.py files below a directory.
+
+        Uses os.scandir, so the type of each entry comes from the
+        directory listing itself and no extra stat() is paid per file.
+        Directories already seen (same device/inode) are skipped, so
+        overlapping trees on the command line are only walked once.
+
+        Args:
+            root: The directory to walk (str)
+            visited_dirs: Set of (st_dev, st_ino) of walked directories
+        """
+        with os.scandir(root) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    if (st.st_dev, st.st_ino) in visited_dirs:
+                        continue
+                    visited_dirs.add((st.st_dev, st.st_ino))
+                    yield from walk_py(entry.path, visited_dirs)
+                elif (entry.name.endswith('.py') and
+                        entry.is_file(follow_symlinks=False)):
+                    yield entry.path
+
+    def handle_path(path, visited_dirs):
         """
         Handle single path from args.config.
         Resolve all relative paths and gather all paths from directories.
 
-        Appends them as pathlib.Path to args.config_paths.
+        Adds them as pathlib.Path to the args.config_paths set.
 
         Args:
             path: The path to be handled (str)
+            visited_dirs: Set of (st_dev, st_ino) of walked directories
         """
         p = Path(path).resolve()
-        if not p.exists():
+        # one stat() instead of separate exists()/is_file()/stat() calls
+        try:
+            st = p.stat()
+        except OSError:
             parser.error('"{}" does not exist!'.format(str(p)))
-        elif p.is_file():
-            args.config_paths.append(p.resolve())
+        if stat.S_ISDIR(st.st_mode):
+            if (st.st_dev, st.st_ino) in visited_dirs:
+                return
+            visited_dirs.add((st.st_dev, st.st_ino))
+            for found in walk_py(str(p), visited_dirs):
+                args.config_paths.add(Path(found))
         else:
-            for path in list(p.glob('**/*.py')):
-                handle_path(path)
+            args.config_paths.add(p)
 
     def handle_paths():
         """
         Handle config-paths from args.config.
         """
         if not args.config:
+            from qutebrowser import app  # Needed for the next import
+            from qutebrowser.utils import standarddir as qute_standarddir
             qute_standarddir._init_config(None)
             args.config_paths = [Path(qute_standarddir.config(), 'config.py')]
             if not args.config_paths[0].is_file():
                 parser.error('No config file(s) provided and "{}" does not '
                              'exist!'.format(args.config_paths[0]))
         else:
-            args.config_paths = []
+            # collect into a set so duplicates are rejected at insertion
+            # time instead of a list(set(...)) round-trip at the end
+            args.config_paths = set()
+            visited_dirs = set()
             for path in args.config:
-                handle_path(path)
-            args.config_paths = list(set(args.config_paths))
+                handle_path(path, visited_dirs)
+            args.config_paths = list(args.config_paths)
 
     parser = argparse.ArgumentParser(prog=__title__,
                                      description=__description__,
@@ -146,68 +212,148 @@ def parse_arguments():
     return args
 
 
+def settings_cache_path(version):
+    """
+    Get the path of the setting-name cache file for a qutebrowser
+    version.
+
+    Args:
+        version: The qutebrowser version (str)
+
+    Return:
+        The cache file path, as pathlib.Path
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME',
+                                os.path.expanduser('~/.cache'))
+    return Path(cache_home, 'qutebrowser-compare-config',
+                'settings-{}.txt'.format(version))
+
+
+@lru_cache(maxsize=None)
 def get_available_settings():
     """
-    Get all available settings from qutebrowser.
+    Get all available setting names from qutebrowser.
+
+    The names are cached on disk keyed by the qutebrowser version, so
+    repeated runs skip configdata.init() entirely and just read one
+    small file.
+
+    Return:
+        Frozenset of setting names
+    """
+    import qutebrowser
+    cache_file = settings_cache_path(qutebrowser.__version__)
+    try:
+        return frozenset(sys.intern(s)
+                         for s in cache_file.read_text().splitlines())
+    except OSError:
+        pass
+    names = frozenset(sys.intern(s)
+                      for s in get_available_setting_defaults())
+    # caching is best-effort; a read-only cache dir is no reason to fail
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        cache_file.write_text('\n'.join(sorted(names)) + '\n')
+    except OSError:
+        pass
+    return names
+
+
+@lru_cache(maxsize=None)
+def get_available_setting_defaults():
+    """
+    Get all available settings with their default values from
+    qutebrowser. Unlike the cached name set, this always needs
+    configdata.init().
 
     Return:
         Dict {setting: default value, ...}
     """
-    qute_configdata.init()
-    return {setting: qute_configdata.DATA[setting].default
-            for setting in qute_configdata.DATA}
+    from qutebrowser import app  # Needed for the next import
+    from qutebrowser.config import configdata as qute_configdata
+    if qute_configdata.DATA is None:
+        qute_configdata.init()
+    return {setting: option.default
+            for setting, option in qute_configdata.DATA.items()}
 
 
-def parse_config_line(line):
+def newline_positions(data, newline='\n'):
     """
-    Get setting name from config-line.
+    Get the offsets of all newlines in a string or bytes-like object.
 
     Args:
-        line: The line from the config-file to be parsed (str)
+        data: The string or buffer to be scanned (str/bytes/mmap)
+        newline: The newline to search for (str or bytes)
 
     Return:
-        Tuple: (Str, Str, Bool) if found, else (None, None, None)
+        List of offsets (int), sorted ascending
     """
-    match = re.search('^(#( )?)?c\.(?P<setting>.*) = (?P<value>.*)', line)
-    if match:
-        if re.search('^#( )?', line):
-            defined = False
-        else:
-            defined = True
+    positions = []
+    pos = data.find(newline)
+    while pos != -1:
+        positions.append(pos)
+        pos = data.find(newline, pos + 1)
+    return positions
 
-        return match.group('setting'), match.group('value'), defined
-    else:
-        return None, None, None
+
+def collect_settings(settings, path, data, regex, newline):
+    """
+    Run the config-line regex over a whole file's contents.
+
+    Line numbers are recovered from the match offsets by bisecting a
+    list of newline positions, which is only built if there is at least
+    one match. Works on both str and bytes-like data; captured groups
+    from bytes data are decoded before storing.
+
+    Args:
+        settings: defaultdict(list) the found settings are added to
+        path: The config-file path, as pathlib.Path
+        data: The file contents (str/bytes/mmap)
+        regex: The compiled pattern matching data's type
+        newline: The newline matching data's type (str or bytes)
+    """
+    newlines = None
+    decode = not isinstance(data, str)
+    path_str = str(path)  # stringify once, not per match
+    for match in regex.finditer(data):
+        if newlines is None:
+            newlines = newline_positions(data, newline)
+        no = bisect_left(newlines, match.start()) + 1
+        location = f'{path_str}:{no}'
+        setting = match.group('setting')
+        value = match.group('value')
+        if decode:
+            setting = setting.decode('utf-8')
+            value = value.decode('utf-8')
+        # interned names make the later set operations pointer compares
+        settings[sys.intern(setting)].append(
+            Entry(location, value.rstrip(), match.group('comment') is None))
 
 
 def parse_config_file(path):
     """
     Parse a single config-file.
 
+    Small files are read into a string; files above _MMAP_THRESHOLD are
+    mmapped instead and matched with the bytes pattern, so the whole
+    file is never copied into Python heap memory.
+
     Args:
         path: A config-file path, as pathlib.Path
 
     Return:
-        Dict {'setting': [{'location': /path/to/file:line-number',
-                           'value': str,
-                           'defined': bool}, ...], ...}
+        Dict {'setting': [Entry(location='/path/to/file:line-number',
+                                value=str, defined=bool), ...], ...}
     """
-    settings = {}
-    with path.open(mode='r') as f:
-        lines = [x.strip() for x in f.readlines()]
-
-    for no, line in enumerate(lines):
-        setting, value, is_set = parse_config_line(line)
-        if setting:
-            location = '{}:{}'.format(str(path), no + 1)
-            if setting in settings:
-                settings[setting].append({'location': location,
-                                          'value': value,
-                                          'defined': is_set})
-            else:
-                settings[setting] = [{'location': location,
-                                      'value': value,
-                                      'defined': is_set}]
+    settings = defaultdict(list)
+    if path.stat().st_size > _MMAP_THRESHOLD:
+        with path.open(mode='rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                collect_settings(settings, path, data,
+                                 _CONFIG_LINE_RE_B, b'\n')
+    else:
+        collect_settings(settings, path, path.read_text(encoding='utf-8'),
+                         _CONFIG_LINE_RE, '\n')
     return settings
 
 
@@ -219,33 +365,23 @@ def get_local_settings(config_paths):
         config_paths: List of paths as pathlib.Path
 
     Return:
-        Dict {'setting': [{'location': /path/to/file:line-number',
-                           'value': str,
-                           'defined': bool}, ...], ...}
+        Dict {'setting': [Entry(location='/path/to/file:line-number',
+                                value=str, defined=bool), ...], ...}
     """
-    settings = {}
-    for path in config_paths:
-        file_config = parse_config_file(path)
-        for setting in file_config:
-            if setting in settings:
-                settings[setting] += file_config[setting]
-            else:
-                settings[setting] = file_config[setting]
-    return settings
-
-
-def compare_dict_keys(dict1, dict2):
-    """
-    Compare keys od two dicts.
-
-    Args:
-        dict1: Base dict
-        dict2: Dict to be substracted
-
-    Return:
-        List of keys from dict1 that are not in dict2
-    """
-    return list(set(dict1.keys()) - set(dict2.keys()))
+    if len(config_paths) == 1:
+        # common case (just config.py): hand the per-file dict through
+        # as-is, no executor and no merge pass
+        return dict(parse_config_file(config_paths[0]))
+
+    settings = defaultdict(list)
+    # parsing is I/O-bound, so overlap the reads across files; map()
+    # yields the per-file results in order, keeping output deterministic
+    max_workers = min(8, len(config_paths) or 1)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for file_config in executor.map(parse_config_file, config_paths):
+            for setting, entries in file_config.items():
+                settings[setting].extend(entries)
+    return dict(settings)
 
 
 def render_it(data, naked):
@@ -269,14 +405,13 @@ def render_it(data, naked):
         for setting in data_list:
             result.append(setting['name'])
     else:
-        format_string = '{0:{length}}\033[1;30m{1}\033[1;m'
-        # very hacky way to get the length of the largest name
-        length = len(max([x['name'] for x in data], key=len)) + 1
+        # single generator pass, no intermediate list of names
+        length = max((len(x['name']) for x in data), default=0) + 1
 
         for setting in data:
-            result.append(format_string.format(setting['name'],
-                                               setting['location'],
-                                               length=length))
+            # str.ljust beats parsing a width format-spec per row
+            result.append(setting['name'].ljust(length)
+                          + DIM + setting['location'] + RESET)
 
             if 'additional_lines' in setting:
                 for line in setting['additional_lines']:
@@ -291,16 +426,16 @@ def process_missing(args, not_local):
 
     Args:
         args: The arguments the script was invoked with
-        not_local: List of strings --> settings not present in local config
+        not_local: Set of strings --> settings not present in local config
 
     Return:
         List of strings
     """
     data = [{'name': setting,
-             'location': 'qute://help/settings.html#{}'.format(setting)}
+             'location': f'qute://help/settings.html#{setting}'}
             for setting in not_local]
 
-    data_sorted = sorted(data, key=lambda k: k['location'])
+    data_sorted = sorted(data, key=by_location)
     if data_sorted:
         return render_it(data_sorted, args.naked)
 
@@ -311,7 +446,7 @@ def process_dropped(args, not_qute, local_settings):
 
     Args:
         args: The arguments the script was invoked with
-        not_qute: List of strings --> settings not available in qutebrowser
+        not_qute: Set of strings --> settings not available in qutebrowser
         local_settings: Dict {'setting': ['/path/to/file:line-number', ...],
                               ...}
 
@@ -328,14 +463,14 @@ def process_dropped(args, not_qute, local_settings):
         Return:
             A list of dicts [{'name': setting, 'location': location}, ...]
         """
-        return [{'name': cur_setting, 'location': location['location']}
+        return [{'name': cur_setting, 'location': location.location}
                 for location in local_settings[cur_setting]]
 
     data = []
     for setting in not_qute:
         data += create_data_list_for_setting(setting)
 
-    data_sorted = sorted(data, key=lambda k: k['location'])
+    data_sorted = sorted(data, key=by_location)
     if data_sorted:
         return render_it(data_sorted, args.naked)
 
@@ -347,7 +482,7 @@ def process_defaults(args, qute_settings, not_qute, local_settings):
     Args:
         args: The arguments the script was invoked with
         qute_settings: Dict of settings {setting: default value, ...}
-        not_qute: List of strings --> settings not available in qutebrowser
+        not_qute: Set of strings --> settings not available in qutebrowser
         local_settings: Dict {'setting': ['/path/to/file:line-number', ...],
                               ...}
 
@@ -358,31 +493,33 @@ def process_defaults(args, qute_settings, not_qute, local_settings):
     for setting, locations in local_settings.items():
         if setting in not_qute:
             continue
+        # invariant across all locations of this setting
+        default_value = qute_settings[setting]
         for location in locations:
-            if location['defined']:
+            if location.defined:
                 continue
 
             try:
-                evaluated_value = eval(location['value'])
+                evaluated_value = parse_value(location.value)
             except Exception as e:
                 print('There was an error evaluating the value "{}":\n'
-                      '{}\n--> {}'.format(location['value'],
-                                          location['location'],
+                      '{}\n--> {}'.format(location.value,
+                                          location.location,
                                           e),
                       file=sys.stderr)
                 sys.exit(1)
 
-            if not evaluated_value == qute_settings[setting]:
-                default = '    {}'.format(qute_settings[setting])
-                url = ('    \033[1;30mqute://help/settings.html#{}'
-                       '\033[1;m'.format(setting))
+            if not evaluated_value == default_value:
+                default = '    {}'.format(default_value)
+                url = ('    ' + DIM
+                       + f'qute://help/settings.html#{setting}' + RESET)
                 additional_lines = [default, url]
 
                 changes.append({'name': setting,
-                                'location': location['location'],
+                                'location': location.location,
                                 'additional_lines': additional_lines})
 
-    changes_sorted = sorted(changes, key=lambda k: k['location'])
+    changes_sorted = sorted(changes, key=by_location)
     if changes_sorted:
         return render_it(changes_sorted, args.naked)
 
@@ -395,26 +532,46 @@ def print_it(result, print_headers):
         result: List of strings
         print_headers: Whether to print the headers (bool)
     """
+    out = []
     for count, result_list in enumerate(result):
         if print_headers:
             # make some space if this is not the first list
             if count > 0:
-                print()
-            print(result_list['header'])
-        for entry in result_list['list']:
-            print(entry)
+                out.append('')
+            out.append(result_list['header'])
+        out.extend(result_list['list'])
+    if out:
+        # one write() instead of one print() per entry
+        sys.stdout.write('\n'.join(out) + '\n')
 
 
 def main():
     """
     qutebrowser-compare-config.py main function.
     """
+    if not sys.stdout.isatty() and hasattr(signal, 'SIGPIPE'):
+        # when piped (e.g. into `head`), die silently on a closed pipe
+        # instead of raising BrokenPipeError on write
+        signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
     args = parse_arguments()
     qute_settings = get_available_settings()
     local_settings = get_local_settings(args.config_paths)
 
-    not_local = compare_dict_keys(qute_settings, local_settings)
-    not_qute = compare_dict_keys(local_settings, qute_settings)
+    # dict key views support the set protocol, so subtract them directly
+    # instead of building throwaway sets from both sides; when one side
+    # is empty both differences are already known
+    if not local_settings:
+        # the frozenset can be handed on as-is, no copy needed
+        not_local, not_qute = qute_settings, set()
+    elif not qute_settings:
+        not_local, not_qute = set(), set(local_settings)
+    else:
+        # probe each element against the other side's existing hash
+        # table instead of letting '-' rebuild one per difference
+        local_keys = local_settings.keys()
+        not_local = {s for s in qute_settings if s not in local_keys}
+        not_qute = {s for s in local_keys if s not in qute_settings}
 
     results = []
 
@@ -443,8 +600,10 @@ def main():
         defaults_header = ('#######################\n'
                            'Changed default values:\n'
                            '#######################')
+        # the default values (and thus configdata.init()) are only
+        # needed when -c/--changed-defaults is requested
         defaults_rendered = process_defaults(args,
-                                             qute_settings,
+                                             get_available_setting_defaults(),
                                              not_qute,
                                              local_settings)
         if defaults_rendered: